@@ -35,6 +35,10 @@ class Task(object):
     :type use_parse_sh: bool
 
     """
+
+    __slots__ = ("task_no", "name", "actions", "depends", "targets", "visible",
+                 "args", "output_dir", "scratch", "actions_raw", "kwargs",
+                 "use_parse_sh", "description")
     
     def __init__(self, name, actions, depends, targets, task_no, visible, actions_raw, kwargs, use_parse_sh):
         # Set a default task number
@@ -7,7 +7,7 @@ import os
 import subprocess
 import collections
 
-from .util import kebab
+from .util import kebab, find_on_path
 from .util.fname import script_wd
 
 logger = logging.getLogger(__name__)
@@ -82,7 +82,7 @@ class Configuration(object):
         
         if defaults:
             self._arguments=collections.OrderedDict(self.get_default_options())
-            for opt, info in self.get_default_options():
+            for opt, info in self._arguments.items():
                 self._shorts.add(info.short)
 
         # remove default options, if provided
@@ -172,11 +172,8 @@ class Configuration(object):
         found_grid="None"
         # check for the grid job submission command for slurm and sge
         for command, grid in [["sbatch","slurm"],["qsub","sge"],["aws","aws"]]:
-            try:
-                output=subprocess.check_output(["which",command],stderr=subprocess.STDOUT)
+            if find_on_path(command):
                 found_grid=grid
-            except subprocess.CalledProcessError:
-                pass
             
         return found_grid
    
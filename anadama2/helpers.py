@@ -39,6 +39,7 @@ import re
 
 import six
 
+from . import Task
 from .util import sh as _sh
 from .util import sugar_list
 
@@ -50,19 +51,37 @@ from .reporters import SHELL_COMMAND
 import pickle as pickle
 import cloudpickle
 
+# task actions known to need cloudpickle, keyed by their code objects
+_needs_cloudpickle = set()
+
+def _actions_key(obj):
+    """Key a task by the code objects of its function actions. Returns
+    None for anything that isn't a Task or has no function actions;
+    those are never remembered as needing cloudpickle."""
+    if not isinstance(obj, Task):
+        return None
+    codes = tuple(getattr(a, "__code__", None) for a in obj.actions or ())
+    if not any(codes):
+        return None
+    return codes
+
+
 def try_pickle_dumps(obj):
     """
-    Try two different packages to pickle task
+    Pickle a task. The standard pickle module is tried first since it's
+    much faster; cloudpickle is used for things pickle can't handle,
+    like closures and lambdas. The choice is remembered so tasks built
+    from the same functions go straight to the right pickler.
     """
-    try:
-        return cloudpickle.dumps(obj)
-    except Exception:
-        pass
-
-    try:
-        return pickle.dumps(obj)
-    except Exception:
-        raise
+    key = _actions_key(obj)
+    if key is None or key not in _needs_cloudpickle:
+        try:
+            return pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, AttributeError, TypeError):
+            if key is not None:
+                _needs_cloudpickle.add(key)
+
+    return cloudpickle.dumps(obj)
 
 
 def file_size(depends):
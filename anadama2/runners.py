@@ -1,11 +1,13 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function
-import time
+import random
+import heapq
 import logging
 import itertools
 import traceback
 import multiprocessing
 import pickle as pickle
+from array import array
 from collections import namedtuple
 
 import six
@@ -15,8 +17,29 @@ from .util import istask
 from . import tracked
 from .helpers import apply_sh, try_pickle_dumps
 
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
 logger = logging.getLogger(__name__)
 
+# Fork local workers where we can: they start with everything this
+# process has already imported instead of importing it all again, and
+# nothing needs pickling to start them.
+try:
+    _mp = multiprocessing.get_context("fork")
+except ValueError:
+    _mp = multiprocessing.get_context()
+except AttributeError:
+    # python 2 always forks
+    _mp = multiprocessing
+
+try:
+    _BaseProcess = multiprocessing.process.BaseProcess
+except AttributeError:
+    _BaseProcess = multiprocessing.Process
+
 
 class TaskResult(namedtuple(
         "TaskResult", ["task_no", "error", "dep_keys", "dep_compares"])):
@@ -45,8 +68,49 @@ class TaskResult(namedtuple(
     :type dep_keys: list of list of str
 
     """
-    pass
+    # no per-instance __dict__; results are created and pickled once
+    # per task
+    __slots__ = ()
+
+
+
+class _ReporterEvent(namedtuple("_ReporterEvent", ["method", "task_no"])):
+    """A reporter call made in a worker process. It's sent back on the
+    result queue for the runner to make on the real reporter."""
+    __slots__ = ()
+
+
+class _QueuedReporter(object):
+    """Stands in for the reporter in local worker processes. Calls are
+    put on the result queue, so they reach the runner in order with the
+    task's result and workers don't need a lock to report."""
+
+    def __init__(self, result_q):
+        self.result_q = result_q
+
+    def task_running(self, task_no):
+        self.result_q.put_nowait(_ReporterEvent("task_running", task_no))
+
+    def task_command(self, task_no):
+        self.result_q.put_nowait(_ReporterEvent("task_command", task_no))
+
+
 
+def _csr(adj, n):
+    """Pack the adjacency ``adj`` of nodes ``0..n-1`` (e.g. a DiGraph's
+    ``succ`` or ``pred``) into two flat arrays. The neighbors of node i
+    are ``indices[indptr[i]:indptr[i+1]]``."""
+    indptr, indices = array("l", [0]), array("l")
+    for i in range(n):
+        if i in adj:
+            indices.extend(adj[i])
+        indptr.append(len(indices))
+    return indptr, indices
+
+
+def _neighbors(csr, i):
+    indptr, indices = csr
+    return indices[indptr[i]:indptr[i+1]]
 
 
 class TaskFailed(Exception):
@@ -59,10 +123,113 @@ class BaseRunner(object):
     def __init__(self, run_context):
         self.ctx = run_context
         self.quit_early = False
+        # parents and children of each task, packed by _csr()
+        self._parents = None
+        self._children = None
+        self._remaining_parents = dict()
+        self._priority = dict()
+        # heap of (priority, task number) for tasks with no parents left
+        self._ready = list()
 
     def run_tasks(self, task_idx_deque):
         raise NotImplementedError()
 
+    def _serialize_task(self, idx):
+        """Pickle task number ``idx`` for handing off to a worker."""
+        try:
+            return try_pickle_dumps(self.ctx.tasks[idx])
+        except Exception as e:
+            msg = ("Unable to serialize task `{}'. "
+                   "Original error was `{}'.")
+            raise ValueError(msg.format(self.ctx.tasks[idx], e))
+
+    def _init_graph(self):
+        dag = self.ctx.dag
+        n = len(self.ctx.tasks)
+        self._parents = _csr(dag.pred, n)
+        self._children = _csr(dag.succ, n)
+
+    def _init_parent_counts(self, task_idx_deque):
+        """Count the unfinished parents of each task in
+        ``task_idx_deque``. A task is ready to run once its count drops
+        to zero."""
+        self._init_graph()
+        done = self.ctx.completed_tasks
+        self._remaining_parents = dict(
+            (idx, sum(1 for p in _neighbors(self._parents, idx)
+                      if p not in done))
+            for idx in task_idx_deque
+        )
+        self._init_priorities(task_idx_deque)
+        self._ready = list()
+        for idx in task_idx_deque:
+            if not self._remaining_parents[idx]:
+                self._push_ready(idx)
+
+    def _init_priorities(self, task_idx_deque):
+        """Rank the tasks by bottom level: the number of tasks in the
+        longest chain from a task to the end of the run. Ready tasks on
+        the critical path are handed out first. Ties keep topological
+        order."""
+        indptr, indices = self._children
+        # tasks not in this run stay at level 0 and don't count
+        levels = [0] * (len(indptr) - 1)
+        self._priority = dict()
+        # tasks are popped off the right of the deque in topological
+        # order, so walking it from the left visits children first
+        for pos, idx in enumerate(task_idx_deque):
+            level = 0
+            for c in indices[indptr[idx]:indptr[idx+1]]:
+                if levels[c] > level:
+                    level = levels[c]
+            levels[idx] = level + 1
+            self._priority[idx] = (-levels[idx], -pos)
+
+    def _push_ready(self, idx):
+        heapq.heappush(self._ready, (self._priority[idx], idx))
+
+    def _pop_ready(self):
+        return heapq.heappop(self._ready)[1]
+
+    def _failed_parent(self, idx):
+        """Return a failed parent of task ``idx`` or None if there
+        aren't any."""
+        failed = self.ctx.failed_tasks
+        if not failed:
+            return None
+        failed_parents = [p for p in _neighbors(self._parents, idx)
+                          if p in failed]
+        return min(failed_parents) if failed_parents else None
+
+    def _handle_results(self, result, result_q):
+        """Handle ``result`` along with any other results or reporter
+        calls already waiting on ``result_q``. Returns False if a task
+        failed and the runner should quit early."""
+        while True:
+            if type(result) is _ReporterEvent:
+                getattr(self.ctx._reporter, result.method)(result.task_no)
+            else:
+                self.n_to_do -= 1
+                self._handle_task_result(result)
+                if self.quit_early and result.error:
+                    return False
+            try:
+                result = result_q.get_nowait()
+            except queue.Empty:
+                return True
+
+    def _handle_task_result(self, result):
+        self.ctx._handle_task_result(result)
+        if result.task_no is None:
+            return
+        # finished either way; children waiting on this task have one
+        # less parent to wait for
+        for child in _neighbors(self._children, result.task_no):
+            if child in self._remaining_parents:
+                self._remaining_parents[child] -= 1
+                if not self._remaining_parents[child]:
+                    self._push_ready(child)
+
 
 class DryRunner(BaseRunner):
 
@@ -130,11 +297,12 @@ class SerialLocalRunner(BaseRunner):
         while task_idx_deque:
             idx = task_idx_deque.pop()
 
-            parents = set(self.ctx.dag.predecessors(idx))
-            failed_parents = parents.intersection(self.ctx.failed_tasks)
-            if failed_parents:
+            failed = self.ctx.failed_tasks
+            failed_parent = next((p for p in self.ctx.dag.predecessors(idx)
+                                  if p in failed), None)
+            if failed_parent is not None:
                 self.ctx._handle_task_result(
-                    parent_failed_result(idx, next(iter(failed_parents))))
+                    parent_failed_result(idx, failed_parent))
                 continue
 
             self.ctx._handle_task_started(idx)
@@ -148,12 +316,78 @@ class SerialLocalRunner(BaseRunner):
                 break
 
 
-def worker_run_loop(work_q, result_q, run_task, reporter=None, lock=None):
+class _SharedPayload(namedtuple("_SharedPayload", ["name", "size"])):
+    """A serialized task that was too large to send through a work queue.
+    The pickle bytes are stored in the shared memory block ``name``
+    instead, and the worker that receives this unlinks the block after
+    reading it.
+    """
+    pass
+
+
+# pickles smaller than this go straight through the work queue's pipe
+_SHARED_PAYLOAD_MIN_SIZE = 1<<20
+
+def _share_payload(pkl):
+    """Move ``pkl`` into shared memory if it's large enough to be worth
+    it and shared memory is available. Returns either ``pkl`` or a
+    ``_SharedPayload`` to put on the work queue."""
+    if shared_memory is None or len(pkl) < _SHARED_PAYLOAD_MIN_SIZE:
+        return pkl
+    shm = shared_memory.SharedMemory(create=True, size=len(pkl))
+    shm.buf[:len(pkl)] = pkl
+    shm.close()
+    return _SharedPayload(shm.name, len(pkl))
+
+
+def _load_payload(pkl):
+    """Deserialize a task from the work queue, reading it out of shared
+    memory if it was put there by ``_share_payload``."""
+    if not isinstance(pkl, _SharedPayload):
+        return pickle.loads(pkl)
+    shm = shared_memory.SharedMemory(name=pkl.name)
+    view = shm.buf[:pkl.size]
+    try:
+        return pickle.loads(view)
+    finally:
+        view.release()
+        shm.close()
+        shm.unlink()
+
+
+# how long to wait on a worker's own queue between steal attempts
+_STEAL_INTERVAL = 0.01
+
+def _get_work(work_q, peer_qs, any_work):
+    """Get the next item of work from ``work_q`` or, if it's empty, from
+    one of the queues in ``peer_qs``. ``any_work`` is a semaphore
+    released once for every item put on any of these queues; a worker
+    sleeps on it until there's work somewhere, so no worker stays idle
+    while a peer's queue has items."""
+    if any_work is None:
+        return work_q.get()
+    any_work.acquire()
+    # one item is now reserved for this worker, though it may still be
+    # on its way through a queue's pipe
+    while True:
+        for q in [work_q] + random.sample(peer_qs, len(peer_qs)):
+            try:
+                return q.get_nowait()
+            except queue.Empty:
+                continue
+        try:
+            return work_q.get(timeout=_STEAL_INTERVAL)
+        except queue.Empty:
+            pass
+
+
+def worker_run_loop(work_q, result_q, run_task, reporter=None, lock=None,
+                    peer_qs=(), any_work=None):
     logger.debug("Starting worker")
     while True:
         try:
             logger.debug("Getting work")
-            pkl, extra = work_q.get()
+            pkl, extra = _get_work(work_q, peer_qs, any_work)
             logger.debug("Got work")
         except IOError as e:
             logger.debug("Received IOError (%s) errno %s from work_q",
@@ -167,7 +401,7 @@ def worker_run_loop(work_q, result_q, run_task, reporter=None, lock=None):
             break
         try:
             logger.debug("Deserializing task")
-            task = pickle.loads(pkl)
+            task = _load_payload(pkl)
             logger.debug("Task deserialized")
         except Exception as e:
             result_q.put_nowait(exception_result(e))
@@ -227,39 +461,51 @@ def _get_task_result(task):
     return TaskResult(task.task_no, None, targ_keys, targ_compares)
 
     
-class ParallelLocalWorker(multiprocessing.Process):
+class ParallelLocalWorker(_mp.Process):
             
-    def __init__(self, work_q, result_q, lock, reporter):
+    def __init__(self, work_q, result_q, lock, reporter, peer_qs=(),
+                 any_work=None):
         super(ParallelLocalWorker, self).__init__()
         self.logger = logger
         self.work_q = work_q
         self.result_q = result_q
         self.lock = lock
         self.reporter = reporter
+        self.peer_qs = list(peer_qs)
+        self.any_work = any_work
 
 
     @staticmethod
     def appropriate_q_class(*args, **kwargs):
-        return multiprocessing.Queue(*args, **kwargs)
+        return _mp.Queue(*args, **kwargs)
     
     @staticmethod
     def appropriate_lock():
-        return multiprocessing.Lock()
+        return _mp.Lock()
 
     def run(self):
-        return worker_run_loop(self.work_q, self.result_q, _run_task_locally, self.reporter, self.lock)
+        return worker_run_loop(self.work_q, self.result_q, _run_task_locally,
+                               self.reporter, self.lock, self.peer_qs,
+                               self.any_work)
 
 
 class ParallelLocalRunner(BaseRunner):
 
     def __init__(self, run_context, jobs):
         super(ParallelLocalRunner, self).__init__(run_context)
-        self.work_q = multiprocessing.Queue()
-        self.result_q = multiprocessing.Queue()
-        self.lock = multiprocessing.Lock()
-        self.reporter = run_context._reporter
-        self.workers = [ ParallelLocalWorker(self.work_q, self.result_q, self.lock, self.reporter)
-                         for _ in range(jobs) ]
+        # each worker gets its own work queue and steals from the
+        # others' queues when it runs dry
+        self.work_qs = [ _mp.Queue() for _ in range(jobs) ]
+        self.any_work = _mp.Semaphore(0)
+        self.result_q = _mp.Queue()
+        self.reporter = _QueuedReporter(self.result_q)
+        self.workers = [
+            ParallelLocalWorker(work_q, self.result_q, None, self.reporter,
+                                [q for q in self.work_qs if q is not work_q],
+                                self.any_work)
+            for work_q in self.work_qs
+        ]
+        self._next_work_q = itertools.cycle(self.work_qs)
         self.started = False
 
 
@@ -269,6 +515,7 @@ class ParallelLocalRunner(BaseRunner):
                       len(task_idx_deque), len(self.workers))
         
         self.n_to_do = len(task_idx_deque)
+        self._init_parent_counts(task_idx_deque)
         while True:
             self._fill_work_q()
             logger.debug("Tasks left to do: %s", self.n_to_do)
@@ -288,10 +535,7 @@ class ParallelLocalRunner(BaseRunner):
                 logger.exception(e)
                 self.terminate()
                 raise
-            else:
-                self.n_to_do -= 1
-                self.ctx._handle_task_result(result)
-            if self.quit_early and result.error:
+            if not self._handle_results(result, self.result_q):
                 logger.debug("Quitting early.")
                 self.terminate()
                 break
@@ -301,28 +545,19 @@ class ParallelLocalRunner(BaseRunner):
 
     def _fill_work_q(self):
         logger.debug("Filling work_q")
-        for _ in range(len(self.task_idx_deque)):
-            idx = self.task_idx_deque.pop()
-            parents = set(self.ctx.dag.predecessors(idx))
-            failed_parents = parents.intersection(self.ctx.failed_tasks)
-            if failed_parents:
-                self.ctx._handle_task_result(
-                    parent_failed_result(idx, failed_parents.pop()))
+        while self._ready:
+            idx = self._pop_ready()
+            failed_parent = self._failed_parent(idx)
+            if failed_parent is not None:
+                self._handle_task_result(
+                    parent_failed_result(idx, failed_parent))
                 self.n_to_do -= 1
                 continue
-            elif parents.difference(self.ctx.completed_tasks):
-                # has undone parents, come back again later
-                self.task_idx_deque.appendleft(idx)
-                continue
-            try:
-                pkl = try_pickle_dumps(self.ctx.tasks[idx])
-            except Exception as e:
-                msg = ("Unable to serialize task `{}'. "
-                       "Original error was `{}'.")
-                raise ValueError(msg.format(self.ctx.tasks[idx], e))
+            pkl = self._serialize_task(idx)
             logger.debug("Adding task %i to work_q", idx)
             self.ctx._handle_task_started(idx)
-            self.work_q.put((pkl, None))
+            next(self._next_work_q).put((_share_payload(pkl), None))
+            self.any_work.release()
             logger.debug("Added task %i to work_q", idx)
         if not self.started:
             logger.debug("Starting up workers")
@@ -333,23 +568,16 @@ class ParallelLocalRunner(BaseRunner):
 
     def terminate(self):
         logger.debug("Terminating all workers")
-        self.work_q._rlock.acquire()
-        logger.debug("got work_q readlock")
-        while self.work_q._reader.poll():
-            logger.debug("draining work_q")
-            try:
-                self.work_q._reader.recv()
-            except EOFError:
-                break
-            time.sleep(0)
+        for work_q in self.work_qs:
+            # work still on the queues is abandoned; don't wait at exit
+            # for it to be flushed to workers that are gone
+            work_q.cancel_join_thread()
         for worker in self.workers:
             logger.debug("terminating worker %s", worker)
             worker.terminate()
         for worker in self.workers:
             logger.debug("joining worker %s", worker)
             worker.join()
-        logger.debug("releasing readlock")
-        self.work_q._rlock.release()
         logger.debug("termination complete")
 
 
@@ -357,7 +585,8 @@ class ParallelLocalRunner(BaseRunner):
         logger.debug("cleaning up parallellocalrunner")
         for w in self.workers:
             logger.debug("giving stop sentinel to worker %s", w)
-            self.work_q.put(({"stop": True}, None))
+            w.work_q.put(({"stop": True}, None))
+            self.any_work.release()
         for w in self.workers:
             logger.debug("joining worker %s", w)
             w.join()
@@ -392,6 +621,7 @@ class GridRunner(BaseRunner):
                       " using the grid",
                      len(task_idx_deque), len(self.workers))
         self.n_to_do = len(task_idx_deque)
+        self._init_parent_counts(task_idx_deque)
         while True:
             self._fill_work_qs()
             logger.debug("Tasks left to do: %s", self.n_to_do)
@@ -408,10 +638,7 @@ class GridRunner(BaseRunner):
                 logger.exception(e)
                 self.terminate()
                 raise
-            else:
-                self.n_to_do -= 1
-                self.ctx._handle_task_result(result)
-            if self.quit_early and result.error:
+            if not self._handle_results(result, self.result_q):
                 logger.debug("Quitting early.")
                 self.terminate()
                 break
@@ -421,9 +648,9 @@ class GridRunner(BaseRunner):
 
     def terminate(self):
         for name, (work_q, _) in self._worker_qs.items():
-            if hasattr(work_q, "_rlock"):
+            if hasattr(work_q, "cancel_join_thread"):
                 self._terminate_mpq(work_q, name)
-            elif hasattr(work_q, "mutex"):
+            elif hasattr(work_q, "get_nowait"):
                 self._terminate_qq(work_q, name)
             else:
                 raise Exception
@@ -452,16 +679,11 @@ class GridRunner(BaseRunner):
 
     def _fill_work_qs(self):
         logger.debug("Filling work_qs")
-        for _ in range(len(self.task_idx_deque)):
+        while self._ready:
             idx = self._get_next_task()
             if idx is None:
                 continue
-            try:
-                pkl = try_pickle_dumps(self.ctx.tasks[idx])
-            except Exception as e:
-                msg = ("Unable to serialize task `{}'. "
-                       "Original error was `{}'.")
-                raise ValueError(msg.format(self.ctx.tasks[idx], e))
+            pkl = self._serialize_task(idx)
             name, extra = self.route(idx)
             logger.debug("Adding task %i to `%s' work_q", idx, name)
             self._worker_qs[name][0].put((pkl, extra))
@@ -477,74 +699,59 @@ class GridRunner(BaseRunner):
 
     def _init_workers(self):
         threads, procs = list(), list()
+        # all workers share one result queue so that waiting for a
+        # result is a single blocking get(). Threads can put on a
+        # multiprocessing queue, but processes can't use a queue.Queue
+        if any(issubclass(worker_cls, _BaseProcess)
+               for worker_cls, _ in self._worker_config.values()):
+            self.result_q = _mp.Queue()
+        else:
+            self.result_q = queue.Queue()
         for name, (worker_cls, n_procs) in self._worker_config.items():
             work_q = worker_cls.appropriate_q_class()
-            result_q = worker_cls.appropriate_q_class()
             lock = worker_cls.appropriate_lock()
-            self._worker_qs[name] = (work_q, result_q)
-            isproc = issubclass(worker_cls, multiprocessing.Process) 
+            self._worker_qs[name] = (work_q, self.result_q)
+            isproc = issubclass(worker_cls, _BaseProcess) 
             l = procs if isproc else threads
             for _ in range(n_procs):
-                l.append(worker_cls(work_q, result_q, lock, self.ctx._reporter))
+                l.append(worker_cls(work_q, self.result_q, lock, self.ctx._reporter))
         self.workers = procs+threads # http://stackoverflow.com/a/13115499
-        self._qcycle = itertools.cycle(val[1]
-                                       for val in self._worker_qs.values())
 
 
     def _get_next_task(self):
-        idx = self.task_idx_deque.pop()
-        parents = set(self.ctx.dag.predecessors(idx))
-        failed_parents = parents.intersection(self.ctx.failed_tasks)
-        if failed_parents:
-            self.ctx._handle_task_result(
-                parent_failed_result(idx, next(iter(failed_parents)))
+        idx = self._pop_ready()
+        failed_parent = self._failed_parent(idx)
+        if failed_parent is not None:
+            self._handle_task_result(
+                parent_failed_result(idx, failed_parent)
                 )
             self.n_to_do -= 1
             return None
-        elif parents.difference(self.ctx.completed_tasks):
-            # has undone parents, come back again later
-            self.task_idx_deque.appendleft(idx)
-            return None
-        if idx is None:
-            raise Exception
         return idx
 
 
     def _get_result(self):
-        while True:
-            for _ in range(len(self.workers)):
-                try:
-                    ret = next(self._qcycle).get(False)
-                except queue.Empty:
-                    continue
-                return ret
-            time.sleep(0.05)
+        return self.result_q.get()
 
 
     def _terminate_mpq(self, q, name):
-        q._rlock.acquire()
-        while q._reader.poll():
-            try:
-                q._reader.recv()
-            except EOFError:
-                break
-            time.sleep(0)
+        q.cancel_join_thread()
         worker_type = self._worker_config[name][0]
         for worker in self.workers:
             if isinstance(worker, worker_type):
                 worker.terminate()
-        q._rlock.release()
 
 
     def _terminate_qq(self, q, name):
-        q.mutex.acquire()
-        while q.queue:
-            q.queue.pop()
-        worker_type = self._worker_config[name][0]
-        for worker in self.workers:
-            if isinstance(worker, worker_type):
-                worker.join()
-        q.mutex.release()
+        # threads can't be killed. Drop the work they haven't started
+        # and have each one stop after its current task
+        while True:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                break
+        for _ in range(self._worker_config[name][1]):
+            q.put(({"stop": True}, None))
         
 
 
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import os
 import sys
+import weakref
 import logging
 import itertools
 from glob import glob
@@ -9,13 +10,15 @@ from collections import defaultdict
 import subprocess
 
 import six
-from six.moves import zip_longest
+from six.moves import zip_longest, copyreg
 
 from .util import _adler32, find_on_path, sh, HasNoEqual
 from .util import istask, Directory
 
 logger = logging.getLogger(__name__)
-_singleton_idx = defaultdict(dict)
+# class name -> key -> dependency. Weak, so that dependencies no task or
+# workflow refers to anymore can be garbage collected
+_singleton_idx = defaultdict(weakref.WeakValueDictionary)
 first = itemgetter(0)
 
 def auto(x):
@@ -60,6 +63,19 @@ def auto(x):
             "Not sure how to make `{}' into a dependency".format(x))
 
 
+def _stat_adler32(dep, stat):
+    """Checksum the file behind ``dep``. The checksum is kept on ``dep``
+    and reused for as long as ``stat`` shows the same size, modify time
+    and inode, so a file compared many times in a run is read once.
+    """
+    key = (stat.st_size, getattr(stat, "st_mtime_ns", stat.st_mtime),
+           stat.st_ino)
+    cached = dep.__dict__.get("_adler32")
+    if cached is None or cached[0] != key:
+        cached = dep._adler32 = (key, _adler32(dep.name))
+    return cached[1]
+
+
 def _autostring(s):
     if s.startswith("s3:/"):
         return AWSHugeTrackedFile(s)
@@ -287,6 +303,9 @@ class TrackedString(Base):
     def key(s):
         return s
 
+    def __reduce__(self):
+        return (self.__class__, (self.name,))
+
     def __str__(self):
         return self.s
 
@@ -323,6 +342,9 @@ class TrackedVariable(Base):
         ns, k = self.name.split(KVDEPSEPARATOR)
         return (ns, k, self.val)
 
+    def __reduce__(self):
+        return (self.__class__, self.__getnewargs__())
+
     def __str__(self):
         return str(self.val)
 
@@ -352,13 +374,21 @@ class TrackedFile(Base):
         stat = os.stat(self.name)
         yield stat.st_size
         yield stat.st_mtime
-        yield _adler32(self.name)
+        yield _stat_adler32(self, stat)
 
 
     @staticmethod
     def key(name):
         return os.path.abspath(name)
 
+    def __reduce_ex__(self, protocol):
+        # for the file classes defined here, the file name is all there is
+        # to rebuild the dependency from. Subclasses may keep more state
+        # in __dict__, so they get the default pickle
+        if type(self) in _name_only_pickle_classes:
+            return (self.__class__, (self.name,))
+        return super(TrackedFile, self).__reduce_ex__(protocol)
+
     def __str__(self):
         return self.name
 
@@ -500,6 +530,11 @@ class AWSHugeTrackedFile(HugeTrackedFile):
         resource = boto3.resource("s3")
         resource.Bucket(self.aws_bucket).upload_file(self.local,self.aws_key)
 
+    def __reduce__(self):
+        # the local paths from set_local_path() aren't derived from the
+        # name, so keep all of __dict__
+        return (copyreg.__newobj__, (self.__class__, self.name), self.__dict__)
+
     def create_temp_folder(self):
         # create all temp folders needed for local path
         directory = os.path.dirname(self.local)
@@ -674,7 +709,7 @@ class TrackedExecutable(Base):
         stat = os.stat(self.name)
         yield stat.st_size
         yield stat.st_mtime
-        yield _adler32(self.name)
+        yield _stat_adler32(self, stat)
 
 
     @staticmethod
@@ -690,6 +725,12 @@ class TrackedExecutable(Base):
                     "Unable to find binary or script `{}'".format(name))
         return p
 
+    def __reduce__(self):
+        # version_command is built from the name given to init(), not
+        # the resolved path
+        return (self.__class__, (self.name,),
+                {"version_command": self.version_command})
+
     def __str__(self):
         return self.name
 
@@ -719,6 +760,9 @@ class TrackedFunction(Base):
     def key(key):
         return key
 
+    def __reduce__(self):
+        return (self.__class__, (self.name, self.fn))
+
 
 
 _cached_dep_classes = (
@@ -729,5 +773,10 @@ _cached_dep_classes = (
     TrackedVariable
 )
 for cls in _cached_dep_classes:
-    _singleton_idx[cls.__name__] = dict()
+    _singleton_idx[cls.__name__] = weakref.WeakValueDictionary()
 del cls
+
+_name_only_pickle_classes = (
+    TrackedFile,        HugeTrackedFile,
+    TrackedFilePattern, TrackedDirectory,
+)
@@ -262,8 +262,44 @@ def memoized(func):
     return memoizer
 
 
-_PATH_list = None
-@memoized
+_PATH_index = (None, {})
+_PATH_listings = {}
+def _path_index():
+    """Map each file name found in the directories of the shell's PATH
+    variable to the directories that hold it, in PATH order. Each
+    directory is listed once and listed again only when its mtime
+    changes; the map is rebuilt if PATH or any of those mtimes change.
+
+    """
+    global _PATH_index
+    path = os.environ.get('PATH', '')
+    dirs = path.split(':')
+    mtimes = []
+    for dir_ in dirs:
+        try:
+            mtimes.append(os.stat(dir_ or os.curdir).st_mtime)
+        except OSError:
+            mtimes.append(None)
+    key = (path, tuple(mtimes))
+    if _PATH_index[0] != key:
+        idx = {}
+        for dir_, mtime in zip(dirs, mtimes):
+            if mtime is None:
+                continue
+            listed_dir = os.path.abspath(dir_ or os.curdir)
+            listing = _PATH_listings.get(listed_dir)
+            if listing is None or listing[0] != mtime:
+                try:
+                    listing = (mtime, os.listdir(listed_dir))
+                except OSError:
+                    continue
+                _PATH_listings[listed_dir] = listing
+            for name in listing[1]:
+                idx.setdefault(name, []).append(dir_)
+        _PATH_index = (key, idx)
+    return _PATH_index[1]
+
+
 def find_on_path(bin_str):
     """ Finds an executable living on the shells PATH variable.
     :param bin_str: String; executable to find
@@ -272,11 +308,11 @@ def find_on_path(bin_str):
     :rtype: str
     """
 
-    global _PATH_list
-    if _PATH_list is None:
-        _PATH_list = os.environ['PATH'].split(':')
-
-    for dir_ in _PATH_list:
+    if os.sep in bin_str:
+        dirs = os.environ.get('PATH', '').split(':')
+    else:
+        dirs = _path_index().get(bin_str, ())
+    for dir_ in dirs:
         candidate = os.path.join(dir_, bin_str)
         if os.path.exists(candidate) and os.access(candidate, os.X_OK):
             return candidate
@@ -475,9 +511,11 @@ def capture(stderr=None, stdout=None):
     if stdout:
         saved_stdout = sys.stdout
         sys.stdout = stdout
-    yield
-    if stderr:
-        sys.stderr = saved_stderr
-    if stdout:
-        sys.stdout = saved_stdout
+    try:
+        yield
+    finally:
+        if stderr:
+            sys.stderr = saved_stderr
+        if stdout:
+            sys.stdout = saved_stdout
     
@@ -92,6 +92,10 @@ class Workflow(object):
         self.tmpdir = None
         self.task_counter = itertools.count()
         self.dag = nx.DiGraph()
+        # (nodes, edges) waiting to be added to the dag by add_tasks()
+        self._dag_batch = None
+        # topological sort of the dag; None once the dag changes
+        self._topo_order = None
         #: tasks is a :class:`anadama2.taskcontainer.TaskContainer`
         #: filled with objects of type :class:`anadama2.Task`. This
         #: list is populated as new tasks are added via
@@ -641,6 +645,36 @@ class Workflow(object):
             return the_task
 
 
+    def add_tasks(self, tasks):
+        """Create and add many :class:`anadama2.Task` to the workflow at
+        once. The new tasks are added to the dependency graph in a
+        single batch instead of one at a time.
+
+        :param tasks: The tasks to add. Each item is either the
+          ``actions`` for a task or a dict of keyword arguments for
+          :meth:`anadama2.workflow.Workflow.add_task`.
+        :type tasks: iterable
+
+        :returns: list of the :class:`anadama2.Task` objects created
+
+        """
+        added = list()
+        self._dag_batch = (list(), list())
+        try:
+            for spec in tasks:
+                if isinstance(spec, dict):
+                    added.append(self.add_task(**spec))
+                else:
+                    added.append(self.add_task(spec))
+        finally:
+            nodes, edges = self._dag_batch
+            self._dag_batch = None
+            self.dag.add_nodes_from(nodes)
+            self.dag.add_edges_from(edges)
+            self._topo_order = None
+        return added
+
+
     def add_task_gridable(self, actions=None, depends=None, targets=None,
                       name=None, interpret_deps_and_targs=True, **gridopts):
         """Add a task to be launched on a grid computing system as specified
@@ -782,9 +816,11 @@ class Workflow(object):
         if dry_run:
             _runner = runners.DryRunner(self)
         _runner.quit_early = quit_early
-        logger.debug("Sorting task_nos by network topology")
-        task_idxs = list(reversed(list(nx.algorithms.dag.topological_sort(self.dag))))
-        logger.debug("Sorting complete")
+        if self._topo_order is None:
+            logger.debug("Sorting task_nos by network topology")
+            self._topo_order = list(nx.algorithms.dag.topological_sort(self.dag))
+            logger.debug("Sorting complete")
+        task_idxs = list(reversed(self._topo_order))
         keep, drop = set(), set()
         if until_task:
             for task_name_or_no in sugar_list(until_task):
@@ -902,10 +938,10 @@ class Workflow(object):
         """Actually add a task to the internal dependency data structure"""
         
         self.tasks.append(task)
-        self.dag.add_node(task.task_no)
+        self._dag_add_node(task.task_no)
         for dep in task.depends:
             if istask(dep):
-                self.dag.add_edge(dep.task_no, task.task_no)
+                self._dag_add_edge(dep.task_no, task.task_no)
                 continue
             if dep in self._depidx:
                 pass
@@ -922,7 +958,7 @@ class Workflow(object):
                 # link to a task. This would happen if someone defined
                 # a preexisting dependency
                 if parent_task is not None:
-                    self.dag.add_edge(parent_task.task_no, task.task_no)
+                    self._dag_add_edge(parent_task.task_no, task.task_no)
         for targ in task.targets: 
             # add targets to the DependencyIndex after looking up
             # dependencies for the current task. Hopefully this avoids
@@ -930,9 +966,35 @@ class Workflow(object):
             self._depidx.link(targ, task)
                 
 
+    def _dag_add_node(self, task_no):
+        self._topo_order = None
+        if self._dag_batch is None:
+            self.dag.add_node(task_no)
+        else:
+            self._dag_batch[0].append(task_no)
+
+
+    def _dag_add_edge(self, parent_no, task_no):
+        self._topo_order = None
+        if self._dag_batch is None:
+            self.dag.add_edge(parent_no, task_no)
+        else:
+            self._dag_batch[1].append((parent_no, task_no))
+
+
+    def _dag_remove_node(self, task_no):
+        self._topo_order = None
+        if self._dag_batch is None:
+            self.dag.remove_node(task_no)
+        else:
+            nodes, edges = self._dag_batch
+            nodes.remove(task_no)
+            edges[:] = [e for e in edges if task_no not in e]
+
+
     def _handle_nosuchdep(self, dep, task):
         self.tasks.pop()
-        self.dag.remove_node(task.task_no)
+        self._dag_remove_node(task.task_no)
         msg = "Unable to find dependency `{}' of type `{}'. "
         msg = msg.format(str(dep), type(dep))
         alldeps = itertools.chain.from_iterable(
@@ -1016,12 +1078,34 @@ def _miss_exc(name):
     raise Exception(msg)
 
 
+# (command, cwd, $PATH) -> tuple of binaries found in the command
+_discovered_binaries = dict()
+
 def discover_binaries(s):
     """Search through string ``s`` and find all existing files smaller
     than 10MB. Return those files as a list of objects of type
     :class:`anadama2.tracked.TrackedExecutable`.
+
+    Results are remembered for each command, working directory and
+    $PATH. Call :func:`_discover_binaries_cache_clear` if executables
+    have since been added or removed.
     """
 
+    key = (s, os.getcwd(), os.environ.get("PATH"))
+    try:
+        return list(_discovered_binaries[key])
+    except KeyError:
+        pass
+    ds = _discover_binaries(s)
+    _discovered_binaries[key] = tuple(ds)
+    return ds
+
+
+def _discover_binaries_cache_clear():
+    _discovered_binaries.clear()
+
+
+def _discover_binaries(s):
     ds = list()
     for term in shlex.split(s):
         if not os.path.exists(term):
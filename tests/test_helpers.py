@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import os
 import shutil
+import pickle
 import unittest
 
 import anadama2.helpers
@@ -46,6 +47,39 @@ class TestHelpers(unittest.TestCase):
         anadama2.helpers.system(["python", '-c' 'import sys; sys.stderr.write(sys.stdin.read());'],
                                stdout_clobber=f, stdin=e)(None)
         self.assertEqual(os.stat(e).st_size, s)
+
+    def test_try_pickle_dumps(self):
+        plain = anadama2.helpers.try_pickle_dumps({"a": 1})
+        self.assertEqual(pickle.loads(plain), {"a": 1})
+        x = 2
+        fn = lambda: x
+        n_known = len(anadama2.helpers._needs_cloudpickle)
+        self.assertEqual(pickle.loads(anadama2.helpers.try_pickle_dumps(fn))(), 2,
+                         "should fall back to cloudpickle for closures")
+        self.assertEqual(len(anadama2.helpers._needs_cloudpickle), n_known,
+                         "only task actions should be remembered")
+
+
+    def test_try_pickle_dumps_tasks(self):
+        def make_task(task_no, actions):
+            return anadama2.Task("task"+str(task_no), actions, [], [],
+                                 task_no, True, actions, {}, False)
+        def add(n):
+            return lambda task: n + 1
+        first, second = make_task(1, [add(1)]), make_task(2, [add(2)])
+        self.assertEqual(pickle.loads(
+            anadama2.helpers.try_pickle_dumps(first)).actions[0](None), 2)
+        key = anadama2.helpers._actions_key(first)
+        self.assertIn(key, anadama2.helpers._needs_cloudpickle)
+        self.assertEqual(anadama2.helpers._actions_key(second), key,
+                         "tasks sharing a closure should go straight to cloudpickle")
+        self.assertEqual(pickle.loads(
+            anadama2.helpers.try_pickle_dumps(second)).actions[0](None), 3)
+        strings = make_task(3, ["echo hello"])
+        self.assertIs(anadama2.helpers._actions_key(strings), None)
+        self.assertEqual(anadama2.helpers.try_pickle_dumps(strings),
+                         pickle.dumps(strings, protocol=pickle.HIGHEST_PROTOCOL),
+                         "tasks with string actions should use stdlib pickle")
         
 
 if __name__ == '__main__':
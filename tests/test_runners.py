@@ -1,12 +1,48 @@
 # -*- coding: utf-8 -*-
 import os
 import shutil
+import pickle
+import tempfile
+import threading
 import unittest
+from collections import deque
+from io import StringIO
+
+import networkx
+from six.moves import queue
 
 import anadama2
 import anadama2.tracked
 import anadama2.runners
 import anadama2.helpers
+import anadama2.util
+import anadama2.cli
+import anadama2.backends
+import anadama2.workflow
+from anadama2.util import capture
+
+
+class ThreadWorker(threading.Thread):
+    def __init__(self, work_q, result_q, lock, reporter):
+        super(ThreadWorker, self).__init__()
+        self.daemon = True
+        self.work_q = work_q
+        self.result_q = result_q
+        self.lock = lock
+        self.reporter = reporter
+
+    @staticmethod
+    def appropriate_q_class(*args, **kwargs):
+        return queue.Queue(*args, **kwargs)
+
+    @staticmethod
+    def appropriate_lock():
+        return threading.Lock()
+
+    def run(self):
+        return anadama2.runners.worker_run_loop(
+            self.work_q, self.result_q, anadama2.runners._run_task_locally,
+            self.reporter, self.lock)
 
 
 class TestRunners(unittest.TestCase):
@@ -78,3 +114,104 @@ class TestRunners(unittest.TestCase):
         self.assertIsNot(ret.error, None, "should have had an error")
 
 
+    def test__get_task_result_many_targets(self):
+        outs = [os.path.join(self.workdir, "out{}.txt".format(i))
+                for i in range(3)]
+        for out in outs[:2]:
+            open(out, 'w').close()
+        t = anadama2.Task(
+            "my task", actions=["true"], depends=[],
+            targets=[anadama2.tracked.auto(o) for o in outs],
+            task_no=1, visible=True, actions_raw=["true"], kwargs={},
+            use_parse_sh=False
+        )
+        ret = anadama2.runners._get_task_result(t)
+        self.assertIn(outs[2], ret.error,
+                      "should report the target that wasn't made")
+        open(outs[2], 'w').close()
+        ret = anadama2.runners._get_task_result(t)
+        self.assertIs(ret.error, None)
+        self.assertEqual(ret.dep_keys, outs)
+        self.assertEqual(ret.dep_compares,
+                         [list(d.compare()) for d in t.targets])
+
+
+    def test_shared_payload(self):
+        if anadama2.runners.shared_memory is None:
+            self.skipTest("multiprocessing.shared_memory is unavailable")
+        small = pickle.dumps(list(range(10)))
+        self.assertIs(anadama2.runners._share_payload(small), small,
+                      "small pickles should go through the queue as is")
+        big = pickle.dumps(b"x"*anadama2.runners._SHARED_PAYLOAD_MIN_SIZE)
+        shared = anadama2.runners._share_payload(big)
+        self.assertIsInstance(shared, anadama2.runners._SharedPayload)
+        self.assertEqual(anadama2.runners._load_payload(shared),
+                         pickle.loads(big))
+
+
+    def test__csr(self):
+        dag = networkx.DiGraph([(0, 2), (1, 2), (2, 3)])
+        dag.add_node(4)
+        kids = anadama2.runners._csr(dag.succ, 5)
+        parents = anadama2.runners._csr(dag.pred, 5)
+        self.assertEqual([list(anadama2.runners._neighbors(kids, i))
+                          for i in range(5)], [[2], [2], [3], [], []])
+        self.assertEqual(sorted(anadama2.runners._neighbors(parents, 2)),
+                         [0, 1])
+
+
+    def test__init_priorities(self):
+        # a chain 0 -> 1 -> 2 next to independent tasks 3 and 4
+        ctx = anadama2.util.Bag()
+        ctx.dag = networkx.DiGraph([(0, 1), (1, 2)])
+        ctx.dag.add_nodes_from([3, 4])
+        ctx.tasks = list(range(5))
+        ctx.completed_tasks = set()
+        runner = anadama2.runners.BaseRunner(ctx)
+        topo_order = [3, 0, 4, 1, 2]
+        runner._init_parent_counts(deque(reversed(topo_order)))
+        levels = dict((idx, -prio[0])
+                      for idx, prio in runner._priority.items())
+        self.assertEqual(levels, {0: 3, 1: 2, 2: 1, 3: 1, 4: 1})
+        ready = [runner._pop_ready() for _ in range(len(runner._ready))]
+        self.assertEqual(ready, [0, 3, 4],
+                         ("the head of the longest chain should go first, "
+                          "then ties in topological order"))
+
+
+    def test_grid_runner_quit_early_threads(self):
+        db_dir = tempfile.mkdtemp(prefix="anadamatest_")
+        old_db_dir = os.environ.get(anadama2.backends.ENV_VAR)
+        os.environ[anadama2.backends.ENV_VAR] = db_dir
+        cfg = anadama2.cli.Configuration(prompt_user=False)
+        cfg._arguments["output"].keywords["default"] = self.workdir
+        ctx = anadama2.workflow.Workflow(vars=cfg)
+        ctx.add_task("exit 1")
+        for i in range(10):
+            ctx.add_task("sleep 0.1")
+        runner = anadama2.runners.GridRunner(ctx)
+        runner.add_worker(ThreadWorker, "threads", rate=2, default=True)
+        def go():
+            try:
+                ctx.go(runner=runner, quit_early=True)
+            except anadama2.workflow.RunFailed:
+                pass
+        try:
+            t = threading.Thread(target=go)
+            t.daemon = True
+            # sys.stdout and sys.stderr are process-wide, so swap them
+            # here rather than from the thread
+            with capture(stderr=StringIO(), stdout=StringIO()):
+                t.start()
+                t.join(10)
+            self.assertFalse(t.is_alive(),
+                             "quitting early with thread workers shouldn't hang")
+        finally:
+            if ctx._backend:
+                ctx._backend.close()
+            anadama2.backends._default_backend = None
+            if old_db_dir is None:
+                del os.environ[anadama2.backends.ENV_VAR]
+            else:
+                os.environ[anadama2.backends.ENV_VAR] = old_db_dir
+            shutil.rmtree(db_dir, ignore_errors=True)
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
+import gc
 import os
 import shutil
+import pickle
 import unittest
 
 import anadama2
@@ -8,6 +10,11 @@ import anadama2.tracked
 import anadama2.backends
 
 
+class RemoteTrackedFile(anadama2.tracked.TrackedFile):
+    def set_remote(self, remote):
+        self.remote = remote
+
+
 class TestTracked(unittest.TestCase):
 
     @classmethod
@@ -61,3 +68,55 @@ class TestTracked(unittest.TestCase):
         with self.assertRaises(ValueError):
             anadama2.tracked.auto(["a", 5])
         
+
+
+    def test_pickle(self):
+        f = anadama2.tracked.TrackedFile(os.path.join(self.workdir, "blah.txt"))
+        s = anadama2.tracked.TrackedString("garglefwonk")
+        for dep in (f, s):
+            self.assertIs(pickle.loads(pickle.dumps(dep)), dep,
+                          "unpickling should give back the same dependency")
+        e = anadama2.tracked.TrackedExecutable("sh")
+        pkl = pickle.dumps(e)
+        del anadama2.tracked._singleton_idx["TrackedExecutable"][e.name]
+        e2 = pickle.loads(pkl)
+        self.assertIsNot(e2, e)
+        self.assertEqual(e2.version_command, e.version_command)
+
+
+    def test_pickle_subclass(self):
+        name = os.path.join(self.workdir, "remote.txt")
+        f = RemoteTrackedFile(name)
+        f.set_remote("s3://bucket/remote.txt")
+        pkl = pickle.dumps(f)
+        del anadama2.tracked._singleton_idx["RemoteTrackedFile"][f.name]
+        f2 = pickle.loads(pkl)
+        self.assertIsNot(f2, f)
+        self.assertEqual(f2.remote, f.remote,
+                         "subclass state should survive pickling")
+        plain = anadama2.tracked.TrackedFile(name)
+        self.assertEqual(plain.__reduce_ex__(2),
+                         (anadama2.tracked.TrackedFile, (plain.name,)))
+
+
+    def test_singletons_released(self):
+        name = os.path.join(self.workdir, "released.txt")
+        f = anadama2.tracked.TrackedFile(name)
+        self.assertIs(anadama2.tracked.TrackedFile(name), f)
+        del f
+        gc.collect()
+        self.assertNotIn(name, anadama2.tracked._singleton_idx["TrackedFile"],
+                         "unreferenced dependencies shouldn't be kept alive")
+
+
+    def test_compare_checksum_reused(self):
+        name = os.path.join(self.workdir, "checksum.txt")
+        with open(name, 'w') as f:
+            f.write("some text")
+        dep = anadama2.tracked.TrackedFile(name)
+        first = list(dep.compare())
+        self.assertEqual(list(dep.compare()), first)
+        with open(name, 'w') as f:
+            f.write("more text, more size")
+        self.assertNotEqual(list(dep.compare())[2], first[2],
+                            "checksum should change when the file does")
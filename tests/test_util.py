@@ -80,7 +80,32 @@ class TestUtil(unittest.TestCase):
         self.assertEqual(len(d.files("*.txt")), 4)
         self.assertEqual(len(d.files("*.tsv")), 4)
         self.assertEqual(d.name, path)
-        
+
+
+    def test_find_on_path(self):
+        prog = os.path.join(self.workdir, "anadama_test_prog")
+        self.assertFalse(anadama2.util.find_on_path("anadama_test_prog"))
+        with open(prog, 'w') as f:
+            f.write("#!/bin/sh\n")
+        os.chmod(prog, 0o755)
+        path = os.environ['PATH']
+        os.environ['PATH'] = os.pathsep.join([self.workdir, path])
+        try:
+            self.assertEqual(anadama2.util.find_on_path("anadama_test_prog"),
+                             prog, "should notice that PATH changed")
+            # a new file in a directory that's already been listed
+            later = os.path.join(self.workdir, "anadama_test_prog2")
+            self.assertFalse(anadama2.util.find_on_path("anadama_test_prog2"))
+            shutil.copy(prog, later)
+            # make sure the directory's mtime moves on coarse filesystems
+            st = os.stat(self.workdir)
+            os.utime(self.workdir, (st.st_atime, st.st_mtime + 1))
+            self.assertEqual(anadama2.util.find_on_path("anadama_test_prog2"),
+                             later, "should notice the new file")
+        finally:
+            os.environ['PATH'] = path
+        self.assertFalse(anadama2.util.find_on_path("anadama_test_prog"))
+
         
 if __name__ == "__main__":
     unittest.main()
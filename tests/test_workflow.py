@@ -4,9 +4,8 @@ import sys
 import time
 import shutil
 import random
+import tempfile
 import unittest
-from datetime import datetime
-from datetime import timedelta
 from io import StringIO
 
 import six
@@ -25,22 +24,22 @@ from anadama2.util import capture
 SLEEPTIME = os.environ.get("ANADAMA_SLEEP_TIME", "0.01")
 SLEEPTIME=float(SLEEPTIME)
 
+monotonic = getattr(time, "monotonic", time.time)
+
 class TestWorkflow(unittest.TestCase):
 
     @classmethod
     def setUpClass(cls):
-        os.environ[anadama2.backends.ENV_VAR] = "/tmp/anadamatest"
+        cls.db_dir = tempfile.mkdtemp(prefix="anadamatest_")
+        os.environ[anadama2.backends.ENV_VAR] = cls.db_dir
     
     @classmethod
     def tearDownClass(cls):
-        if os.path.isdir("/tmp/anadamatest"):
-            shutil.rmtree("/tmp/anadamatest")
+        shutil.rmtree(cls.db_dir, ignore_errors=True)
 
 
     def setUp(self):
-        self.workdir = "/tmp/anadama_testdir"
-        if not os.path.isdir(self.workdir):
-            os.mkdir(self.workdir)
+        self.workdir = tempfile.mkdtemp(prefix="anadama_testdir_")
         cfg = anadama2.cli.Configuration(prompt_user=False)
         cfg._arguments["output"].keywords["default"]=self.workdir
         self.ctx = anadama2.workflow.Workflow(vars=cfg)
@@ -53,8 +52,8 @@ class TestWorkflow(unittest.TestCase):
             self.ctx._backend = None
             anadama2.backends._default_backend = None
             
-        if os.path.isdir(self.workdir):
-            shutil.rmtree(self.workdir)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+        anadama2.workflow._discover_binaries_cache_clear()
         
 
     def test_hasattributes(self):
@@ -111,8 +110,7 @@ class TestWorkflow(unittest.TestCase):
         bash_script = os.path.join(self.workdir, "test.sh")
         echoprog = anadama2.util.sh(("which", "echo"))[0].strip().decode("utf-8")
         with open(bash_script, 'w') as f:
-            f.write("#!/bin/bash\n")
-            f.write("echo hi\n")
+            f.write("#!/bin/bash\necho hi\n")
         os.chmod(bash_script, 0o755)
         plain_file = os.path.join(self.workdir, "blah.txt")
         with open(plain_file, 'w') as f:
@@ -137,6 +135,11 @@ class TestWorkflow(unittest.TestCase):
         ret = anadama2.workflow.discover_binaries("ls /bin/")
         self.assertEqual(len(ret), 1, "shouldn't discover directories")
 
+        ret = anadama2.workflow.discover_binaries("echo hi")
+        ret.append(None)
+        self.assertNotIn(None, anadama2.workflow.discover_binaries("echo hi"),
+                         "callers shouldn't be able to change cached results")
+
         
 
     def test_do_targets(self):
@@ -251,6 +254,20 @@ class TestWorkflow(unittest.TestCase):
         # check for the two tasks plus the track pre-existing dependencies task
         self.assertEqual(len(self.ctx.tasks), 3)
 
+    def test_add_tasks(self):
+        a = os.path.join(self.workdir, "a.txt")
+        t1, t2 = self.ctx.add_tasks([
+            dict(actions="touch [targets[0]]", targets=a),
+            dict(actions=anadama2.util.noop, depends=a),
+        ])
+        self.assertEqual(len(self.ctx.tasks), 2)
+        self.assertIn((t1.task_no, t2.task_no), self.ctx.dag.edges())
+        with self.assertRaises(KeyError):
+            self.ctx.add_tasks([dict(actions=anadama2.util.noop,
+                                     depends=a+".nope")])
+        self.assertEqual(len(self.ctx.tasks), 2)
+        self.assertEqual(len(self.ctx.dag), 2)
+
     def test_add_task_deps(self):
         self.ctx.already_exists("/etc/hosts")
         t1 = self.ctx.add_task(anadama2.util.noop, depends=["/etc/hosts"])
@@ -321,13 +338,12 @@ class TestWorkflow(unittest.TestCase):
         
         
     def test_go_parallel(self):
-        for _ in range(10):
-            self.ctx.add_task("sleep 0.5")
-        earlier = datetime.now()
+        self.ctx.add_tasks(["sleep 0.5"]*10)
+        earlier = monotonic()
         with capture(stderr=StringIO()):
             self.ctx.go(jobs=10)
-        later = datetime.now()
-        self.assertLess(later-earlier, timedelta(seconds=5))
+        later = monotonic()
+        self.assertLess(later-earlier, 5.0)
 
 
     def test_issue1(self):
@@ -435,16 +451,29 @@ class TestWorkflow(unittest.TestCase):
 
     def test_go_skip(self):
         outf = os.path.join(self.workdir, "blah.txt")
-        self.ctx.add_task("touch [targets[0]]", targets=[outf])
+        t1 = self.ctx.add_task("touch [targets[0]]", targets=[outf])
         with capture(stderr=StringIO()):
             self.ctx.go()
         ctime = os.stat(outf).st_ctime
-        time.sleep(SLEEPTIME)
         with capture(stderr=StringIO()):
             self.ctx.go()
+        self.assertIs(self.ctx.task_results[t1.task_no], None,
+                      "the task should have been skipped")
         self.assertEqual(ctime, os.stat(outf).st_ctime)
 
 
+    def test_go_add_after_go(self):
+        a, b = [os.path.join(self.workdir, letter+".txt") for letter in "ab"]
+        self.ctx.add_task("touch [targets[0]]", targets=[a])
+        with capture(stderr=StringIO()):
+            self.ctx.go()
+        self.ctx.add_task("touch [targets[0]]", depends=[a], targets=[b])
+        with capture(stderr=StringIO()):
+            self.ctx.go()
+        self.assertTrue(os.path.exists(b),
+                        "tasks added after go() should run on the next go()")
+
+
     def test_go_skip_notargets(self):
         a,b,c,d = [os.path.join(self.workdir, letter+".txt")
                    for letter in ("a", "b", "c", "d")]